@@ -7,19 +7,35 @@ Usage:
 """
 
 import argparse
-import json
+import functools
+import os
 import re
-import subprocess
 import sys
 from pathlib import Path
-from typing import List
+from typing import FrozenSet, List, Optional, Set, Tuple
+
+# Basic semver validation (supports pre-release versions)
+_VERSION_RE = re.compile(r'^\d+\.\d+\.\d+(-[a-zA-Z0-9.-]+)?$')
+
+# A version = "..." line in a TOML table
+_TOML_VERSION_LINE_RE = re.compile(r'^(\s*version\s*=\s*)"[^"]*"')
+
+# A key = "..." line in a TOML table
+_TOML_STRING_LINE_RE = re.compile(r'^\s*([\w-]+)\s*=\s*"([^"]*)"')
+
+# A "version": "..." line in a package.json, along with its indentation
+_PACKAGE_JSON_VERSION_RE = re.compile(r'^([ \t]*)"version"\s*:\s*"([^"]*)"', re.MULTILINE)
+
+# The indentation of the first key in a package.json, i.e. of top-level keys
+_PACKAGE_JSON_INDENT_RE = re.compile(r'\s*\{[ \t]*\r?\n([ \t]*)"')
+
+# The [workspace] table header in a Cargo.toml
+_CARGO_WORKSPACE_RE = re.compile(r'^\[workspace\]', re.MULTILINE)
 
 
 def parse_version(version: str) -> str:
     """Validate and normalize version string."""
-    # Basic semver validation (supports pre-release versions)
-    pattern = r'^\d+\.\d+\.\d+(-[a-zA-Z0-9.-]+)?$'
-    if not re.match(pattern, version):
+    if not _VERSION_RE.match(version):
         raise ValueError(
             f"Invalid version format: {version}. "
             "Expected format: X.Y.Z or X.Y.Z-pre.N"
@@ -27,70 +43,325 @@ def parse_version(version: str) -> str:
     return version
 
 
-def update_cargo_toml(file_path: Path, new_version: str) -> bool:
-    """Update version in a Cargo.toml file."""
+def _relative_path(path: Path, root: Path) -> str:
+    """Return path relative to the project root, or unchanged if it is not under it.
+
+    This is a plain string prefix check, so unlike Path.relative_to it never
+    raises. A path that is outside the root, or whose casing differs from
+    it, comes back as it was.
+    """
+    path_str = str(path)
+    root_str = str(root)
+    if path_str == root_str:
+        return '.'
+    root_str += os.sep
+    return path_str[len(root_str):] if path_str.startswith(root_str) else path_str
+
+
+def _write_temp(file_path: Path, content: str) -> Path:
+    """Write content to a temporary file next to file_path and return its path.
+
+    Renaming the temporary file over file_path with os.replace is atomic, so
+    an interrupted run never leaves a truncated or half-written file behind.
+    The temporary file gets file_path's permissions and is created next to the
+    symlink target if file_path is a symlink; rename it over
+    file_path.resolve() so the link itself is kept.
+    """
+    import stat
+    import tempfile
+
+    target = file_path.resolve()
+    fd, tmp_name = tempfile.mkstemp(
+        dir=target.parent, prefix=f'.{target.name}.', suffix='.tmp'
+    )
+    tmp_path = Path(tmp_name)
+    try:
+        os.fchmod(fd, stat.S_IMODE(os.stat(target).st_mode))
+        data = memoryview(content.encode('utf-8'))
+        while data:
+            data = data[os.write(fd, data):]
+    except BaseException:
+        os.close(fd)
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.close(fd)
+    return tmp_path
+
+
+def _atomic_write(file_path: Path, content: str) -> None:
+    """Replace the contents of file_path atomically."""
+    tmp_path = _write_temp(file_path, content)
+    try:
+        os.replace(tmp_path, file_path.resolve())
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _cargo_package_line(lines: List[str], key: str) -> Optional[int]:
+    """Find the first key = "..." line under [package] in a single pass over the lines."""
+    in_package = False
+    for i, line in enumerate(lines):
+        stripped = line.lstrip()
+        if stripped.startswith('['):
+            in_package = stripped.startswith('[package]')
+        elif in_package:
+            match = _TOML_STRING_LINE_RE.match(line)
+            if match and match.group(1) == key:
+                return i
+    return None
+
+
+def _set_cargo_package_version(content: str, new_version: str) -> Tuple[str, bool]:
+    """Rewrite the version under [package] in a Cargo.toml."""
+    lines = content.splitlines(keepends=True)
+    i = _cargo_package_line(lines, 'version')
+    if i is None:
+        return content, False
+    lines[i] = _TOML_VERSION_LINE_RE.sub(rf'\1"{new_version}"', lines[i], count=1)
+    return ''.join(lines), True
+
+
+def _package_json_version(content: str) -> Optional[re.Match]:
+    """Find the top-level "version" line in a package.json, if any.
+
+    Nested objects such as "engines" may have a "version" of their own, so
+    only a line at the indentation of the top-level keys counts.
+    """
+    indent = _PACKAGE_JSON_INDENT_RE.match(content)
+    if indent is None:
+        return None
+    for match in _PACKAGE_JSON_VERSION_RE.finditer(content):
+        if match.group(1) == indent.group(1):
+            return match
+    return None
+
+
+def _current_version(file_path: Path) -> Optional[str]:
+    """Read the current version from a Cargo.toml or package.json, if any."""
     try:
-        content = file_path.read_text()
+        content = file_path.read_text(encoding='utf-8')
+    except OSError:
+        return None
 
-        # Find and replace the version line under [package]
-        # Match version = "..." with proper spacing
-        pattern = r'(^\[package\].*?^version\s*=\s*)"[^"]*"'
-        replacement = rf'\1"{new_version}"'
-
-        new_content = re.sub(
-            pattern,
-            replacement,
-            content,
-            count=1,
-            flags=re.MULTILINE | re.DOTALL
-        )
+    if file_path.name == 'Cargo.toml':
+        lines = content.splitlines()
+        i = _cargo_package_line(lines, 'version')
+        return None if i is None else _TOML_STRING_LINE_RE.match(lines[i]).group(2)
 
-        if new_content == content:
+    match = _package_json_version(content)
+    if match is not None:
+        return match.group(2)
+
+    # Not laid out one key per line, e.g. a single-line file
+    import json
+
+    try:
+        return json.loads(content).get('version')
+    except ValueError:
+        return None
+
+
+def _cargo_lock_packages(lines: List[str]) -> List[Tuple[str, Optional[int], bool]]:
+    """Scan the [[package]] entries of a Cargo.lock in a single pass over the lines.
+
+    Returns the name of each package, the index of its version line, and
+    whether it has a source, i.e. comes from a registry or git rather than
+    a path.
+    """
+    packages = []
+    entry = None
+    # A trailing header flushes the last [[package]] entry
+    for i, line in enumerate(lines + ['[[package]]']):
+        stripped = line.lstrip()
+        if stripped.startswith('['):
+            if entry is not None and entry[0] is not None:
+                packages.append(tuple(entry))
+            entry = [None, None, False] if stripped.startswith('[[package]]') else None
+        elif entry is not None:
+            match = _TOML_STRING_LINE_RE.match(line)
+            if match and match.group(1) == 'name':
+                entry[0] = match.group(2)
+            elif match and match.group(1) == 'version':
+                entry[1] = i
+            elif match and match.group(1) == 'source':
+                entry[2] = True
+    return packages
+
+
+def _local_cargo_lock_packages(content: str) -> List[str]:
+    """List the Cargo.lock packages that come from a path rather than a registry or git."""
+    return [
+        name for name, _, has_source in _cargo_lock_packages(content.splitlines())
+        if not has_source
+    ]
+
+
+def update_cargo_toml(
+    file_path: Path,
+    new_version: str,
+    root: Path,
+    pending_writes: List[Tuple[Path, Path]],
+    crate_names: Set[str],
+) -> bool:
+    """Update version in a Cargo.toml file.
+
+    The new contents go to a temporary file, which is queued in
+    pending_writes for the caller to move into place. The crate name is
+    added to crate_names so the lock files can be patched afterwards.
+    """
+    try:
+        content = file_path.read_text(encoding='utf-8')
+
+        lines = content.splitlines()
+        i = _cargo_package_line(lines, 'name')
+        if i is not None:
+            crate_names.add(_TOML_STRING_LINE_RE.match(lines[i]).group(2))
+
+        # Find and replace the version line under [package]
+        new_content, found = _set_cargo_package_version(content, new_version)
+        if not found:
             print(f"Warning: No version field found in {file_path}")
             return False
 
-        file_path.write_text(new_content)
-        print(f" Updated {file_path.relative_to(file_path.parents[3])}")
+        # Leave the file untouched so Cargo's mtime-based caching is not invalidated
+        if new_content == content:
+            print(f"  (unchanged) {_relative_path(file_path, root)}")
+            return True
+
+        pending_writes.append((_write_temp(file_path, new_content), file_path))
         return True
 
+    except FileNotFoundError:
+        raise
     except Exception as e:
         print(f"Error updating {file_path}: {e}", file=sys.stderr)
         return False
 
 
-def update_package_json(file_path: Path, new_version: str) -> bool:
-    """Update version in a package.json file."""
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+def update_package_json(
+    file_path: Path, new_version: str, root: Path, pending_writes: List[Tuple[Path, Path]]
+) -> bool:
+    """Update version in a package.json file.
 
-        if 'version' not in data:
-            print(f"Warning: No version field found in {file_path}")
-            return False
+    The new contents go to a temporary file, which is queued in
+    pending_writes for the caller to move into place.
+    """
+    import json
 
-        data['version'] = new_version
+    try:
+        content = file_path.read_text(encoding='utf-8')
+
+        # Substitute the version in place so the rest of the file keeps its
+        # exact formatting, and make sure it really was the top-level version
+        # that changed
+        new_content = None
+        match = _package_json_version(content)
+        if match is not None:
+            start, end = match.span(2)
+            new_content = content[:start] + new_version + content[end:]
+            if json.loads(new_content).get('version') != new_version:
+                new_content = None
+
+        # Otherwise, e.g. for a single-line file, round-trip it through json
+        if new_content is None:
+            data = json.loads(content)
+            if 'version' not in data:
+                print(f"Warning: No version field found in {file_path}")
+                return False
+            data['version'] = new_version
+            new_content = json.dumps(data, indent=2) + '\n'
 
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-            f.write('\n')  # Add trailing newline
+        if new_content == content:
+            print(f"  (unchanged) {_relative_path(file_path, root)}")
+            return True
 
-        print(f" Updated {file_path.relative_to(file_path.parents[3])}")
+        pending_writes.append((_write_temp(file_path, new_content), file_path))
         return True
 
+    except FileNotFoundError:
+        raise
     except Exception as e:
         print(f"Error updating {file_path}: {e}", file=sys.stderr)
         return False
 
 
-def update_cargo_lock(crate_dir: Path) -> bool:
-    """Update Cargo.lock by regenerating it in the crate directory."""
+@functools.lru_cache(maxsize=None)
+def _workspace_root_of(cargo_toml: Path, root: Path) -> Path:
+    """Find the Cargo workspace root (where Cargo.lock lives) for a crate.
+
+    The search stops at the project root, so a checkout nested under some
+    unrelated workspace is not mistaken for one of its members.
+    """
+    directory = cargo_toml.parent
+    while True:
+        manifest = directory / 'Cargo.toml'
+        if manifest.is_file() and _CARGO_WORKSPACE_RE.search(manifest.read_text(encoding='utf-8')):
+            return directory
+        if directory == root or directory == directory.parent:
+            break
+        directory = directory.parent
+    # Not part of a workspace, so the crate is its own root
+    return cargo_toml.parent
+
+
+def patch_cargo_lock(crate_dir: Path, new_version: str, crate_names: FrozenSet[str]) -> bool:
+    """Rewrite the versions of our own crates in Cargo.lock in place.
+
+    A release only changes the versions of path crates, which cannot change
+    how any other dependency resolves, so there is no need to run cargo.
+    """
+    lock_file = crate_dir / 'Cargo.lock'
+    try:
+        content = lock_file.read_text(encoding='utf-8')
+    except FileNotFoundError:
+        # Nothing to patch, so let cargo generate the lock file
+        return update_cargo_lock(crate_dir, new_version)
+
+    try:
+        lines = content.splitlines(keepends=True)
+        for name, i, has_source in _cargo_lock_packages(lines):
+            if name in crate_names and not has_source and i is not None:
+                lines[i] = _TOML_VERSION_LINE_RE.sub(rf'\1"{new_version}"', lines[i], count=1)
+        new_content = ''.join(lines)
+
+        if new_content != content:
+            _atomic_write(lock_file, new_content)
+        return True
+
+    except Exception as e:
+        print(f"Error updating Cargo.lock: {e}", file=sys.stderr)
+        return False
+
+
+def update_cargo_lock(crate_dir: Path, new_version: str) -> bool:
+    """Update Cargo.lock by regenerating it in the crate directory.
+
+    Cargo picks the new version up from the already updated Cargo.toml files.
+    """
+    import subprocess
+
     try:
-        # Use cargo generate-lockfile to force regeneration of Cargo.lock
-        # This ensures path dependencies get their versions updated
+        # Only re-resolve our own path crates, leaving the rest of the
+        # dependency graph as it is. Without an existing Cargo.lock there is
+        # nothing to update, so generate one.
+        try:
+            packages = _local_cargo_lock_packages((crate_dir / 'Cargo.lock').read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            packages = []
+
+        if packages:
+            command = ['cargo', 'update']
+            for package in packages:
+                command += ['-p', package]
+        else:
+            command = ['cargo', 'generate-lockfile']
+
         result = subprocess.run(
-            ['cargo', 'generate-lockfile'],
+            command,
             cwd=crate_dir,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            bufsize=-1,
             text=True
         )
 
@@ -105,13 +376,44 @@ def update_cargo_lock(crate_dir: Path) -> bool:
         return False
 
 
-def update_package_lock(package_dir: Path) -> bool:
-    """Update package-lock.json by running npm install."""
+def update_package_lock(package_dir: Path, new_version: str) -> bool:
+    """Update the package's own version in package-lock.json in place."""
+    import json
+
+    lock_file = package_dir / 'package-lock.json'
+    try:
+        with open(lock_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        data = json.loads(content)
+
+        data['version'] = new_version
+        if '' in data.get('packages', {}):
+            data['packages']['']['version'] = new_version
+        new_content = json.dumps(data, indent=2, ensure_ascii=False) + '\n'
+
+        if new_content != content:
+            _atomic_write(lock_file, new_content)
+        return True
+
+    except Exception as e:
+        print(f"Error updating package-lock.json: {e}", file=sys.stderr)
+        return False
+
+
+def install_package_lock(package_dir: Path, new_version: str) -> bool:
+    """Update package-lock.json by running npm install.
+
+    npm picks the new version up from the already updated package.json.
+    """
+    import subprocess
+
     try:
         result = subprocess.run(
             ['npm', 'install'],
             cwd=package_dir,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            bufsize=-1,
             text=True
         )
 
@@ -126,6 +428,179 @@ def update_package_lock(package_dir: Path) -> bool:
         return False
 
 
+def _run_git(root: Path, args: List[str], input: Optional[str] = None):
+    """Run a git command in the project root, capturing its output."""
+    import subprocess
+
+    return subprocess.run(
+        ['git'] + args,
+        cwd=root,
+        input=input,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=-1,
+        text=True
+    )
+
+
+def _commit_and_tag_with_pygit2(root: Path, files: List[str], commit_message: str, tag_name: str) -> bool:
+    """Commit the given files on top of HEAD and tag the commit in-process with pygit2.
+
+    Like the plumbing path, this skips the commit hooks and commit.gpgSign.
+    """
+    import pygit2
+
+    try:
+        repo = pygit2.Repository(str(root))
+        index = repo.index
+
+        # Like git add, leave out ignored files unless they are already tracked
+        ignored = [path for path in files if path not in index and repo.path_is_ignored(path)]
+        for path in ignored:
+            print(f"Skipping ignored file: {path}")
+
+        for path in files:
+            if path not in ignored:
+                index.add(path)
+        index.write()
+        tree = index.write_tree()
+    except Exception as e:
+        print(f"Error staging changes: {e}", file=sys.stderr)
+        return False
+
+    try:
+        parent = repo.head.peel(pygit2.Commit)
+        if tree == parent.tree_id:
+            print("Error creating commit: nothing to commit", file=sys.stderr)
+            return False
+        signature = repo.default_signature
+        commit = repo.create_commit('HEAD', signature, signature, commit_message, tree, [parent.id])
+    except Exception as e:
+        print(f"Error creating commit: {e}", file=sys.stderr)
+        return False
+
+    try:
+        repo.create_reference(f'refs/tags/{tag_name}', commit)
+    except Exception as e:
+        print(f"Error creating tag: {e}", file=sys.stderr)
+        return False
+
+    return True
+
+
+def _commit_and_tag_with_plumbing(root: Path, files: List[str], commit_message: str, tag_name: str) -> bool:
+    """Commit the given files on top of HEAD and tag the commit using git plumbing.
+
+    Unlike git add and git commit, the plumbing commands only ever look at
+    the files we changed instead of scanning the whole worktree. Note that
+    going through commit-tree skips the commit hooks and commit.gpgSign.
+    """
+    # Like git add, leave out ignored files unless they are already tracked.
+    # check-ignore exits with 1 when none of the paths are ignored.
+    result = _run_git(root, ['check-ignore', '--stdin'], '\n'.join(files) + '\n')
+    if result.returncode not in (0, 1):
+        print(f"Error staging changes: {result.stderr}", file=sys.stderr)
+        return False
+
+    ignored = set(result.stdout.splitlines())
+    for path in files:
+        if path in ignored:
+            print(f"Skipping ignored file: {path}")
+    files = [path for path in files if path not in ignored]
+
+    # update-index hashes the listed paths and applies git's own filters and
+    # file mode rules (core.fileMode), without touching any other entry
+    result = _run_git(root, ['update-index', '--add', '--stdin'], '\n'.join(files) + '\n')
+    if result.returncode != 0:
+        print(f"Error staging changes: {result.stderr}", file=sys.stderr)
+        return False
+
+    result = _run_git(root, ['write-tree'])
+    if result.returncode != 0:
+        print(f"Error staging changes: {result.stderr}", file=sys.stderr)
+        return False
+    tree = result.stdout.strip()
+
+    result = _run_git(root, ['rev-parse', 'HEAD', 'HEAD^{tree}'])
+    if result.returncode != 0:
+        print(f"Error creating commit: {result.stderr}", file=sys.stderr)
+        return False
+    parent, parent_tree = result.stdout.split()
+
+    if tree == parent_tree:
+        print("Error creating commit: nothing to commit", file=sys.stderr)
+        return False
+
+    result = _run_git(root, ['commit-tree', tree, '-p', parent, '-m', commit_message])
+    if result.returncode != 0:
+        print(f"Error creating commit: {result.stderr}", file=sys.stderr)
+        return False
+    commit = result.stdout.strip()
+
+    result = _run_git(root, ['update-ref', '-m', f"commit: {commit_message}", 'HEAD', commit, parent])
+    if result.returncode != 0:
+        print(f"Error creating commit: {result.stderr}", file=sys.stderr)
+        return False
+
+    result = _run_git(root, ['tag', tag_name, commit])
+    if result.returncode != 0:
+        print(f"Error creating tag: {result.stderr}", file=sys.stderr)
+        return False
+
+    return True
+
+
+def _head_release_state(root: Path, commit_message: str, tag_name: str) -> Tuple[bool, bool]:
+    """Check whether HEAD is the release commit, and whether the tag points at it."""
+    try:
+        import pygit2
+    except ImportError:
+        try:
+            head = _run_git(root, ['log', '-1', '--format=%H%n%s'])
+            tag = _run_git(root, ['rev-parse', '-q', '--verify', f'refs/tags/{tag_name}^{{commit}}'])
+        except OSError:
+            # No usable git, so treat the release as not done yet
+            return False, False
+        if head.returncode != 0:
+            return False, False
+        head_id, _, subject = head.stdout.rstrip('\n').partition('\n')
+        tagged = tag.returncode == 0 and tag.stdout.strip() == head_id
+        return subject == commit_message, tagged
+
+    try:
+        repo = pygit2.Repository(str(root))
+        head = repo.head.peel(pygit2.Commit)
+        tag = repo.references.get(f'refs/tags/{tag_name}')
+        tagged = tag is not None and tag.peel(pygit2.Commit).id == head.id
+        return head.message.split('\n', 1)[0] == commit_message, tagged
+    except Exception:
+        return False, False
+
+
+def _tag_head(root: Path, tag_name: str) -> bool:
+    """Tag HEAD, for a release whose commit was created but not tagged."""
+    try:
+        import pygit2
+    except ImportError:
+        try:
+            result = _run_git(root, ['tag', tag_name, 'HEAD'])
+        except OSError as e:
+            print(f"Error creating tag: {e}", file=sys.stderr)
+            return False
+        if result.returncode != 0:
+            print(f"Error creating tag: {result.stderr}", file=sys.stderr)
+            return False
+        return True
+
+    try:
+        repo = pygit2.Repository(str(root))
+        repo.create_reference(f'refs/tags/{tag_name}', repo.head.peel(pygit2.Commit).id)
+    except Exception as e:
+        print(f"Error creating tag: {e}", file=sys.stderr)
+        return False
+    return True
+
+
 def git_commit_and_tag(root: Path, version: str, components: list) -> bool:
     """Create a git commit and tag for the version update."""
     try:
@@ -135,7 +610,7 @@ def git_commit_and_tag(root: Path, version: str, components: list) -> bool:
         files_to_add = []
         for component in components:
             # Add version file (Cargo.toml or package.json)
-            files_to_add.append(str(component['version_file'].relative_to(root)))
+            files_to_add.append(_relative_path(component['version_file'], root))
 
             # Add lock file (Cargo.lock or package-lock.json)
             if 'Cargo.toml' in str(component['version_file']):
@@ -143,48 +618,25 @@ def git_commit_and_tag(root: Path, version: str, components: list) -> bool:
             else:
                 lock_file = component['lock_dir'] / 'package-lock.json'
 
-            if lock_file.exists():
-                files_to_add.append(str(lock_file.relative_to(root)))
-
-        result = subprocess.run(
-            ['git', 'add'] + files_to_add,
-            cwd=root,
-            capture_output=True,
-            text=True
-        )
-
-        if result.returncode != 0:
-            print(f"Error staging changes: {result.stderr}", file=sys.stderr)
-            return False
+            lock_path = _relative_path(lock_file, root)
+            if lock_file.exists() and lock_path not in files_to_add:
+                files_to_add.append(lock_path)
 
-        # Commit
         commit_message = f"AgentFS {version}"
-        result = subprocess.run(
-            ['git', 'commit', '-m', commit_message],
-            cwd=root,
-            capture_output=True,
-            text=True
-        )
-
-        if result.returncode != 0:
-            print(f"Error creating commit: {result.stderr}", file=sys.stderr)
-            return False
-
-        print(f"✓ Created commit: {commit_message}")
-
-        # Create tag
         tag_name = f"v{version}"
-        result = subprocess.run(
-            ['git', 'tag', tag_name],
-            cwd=root,
-            capture_output=True,
-            text=True
-        )
 
-        if result.returncode != 0:
-            print(f"Error creating tag: {result.stderr}", file=sys.stderr)
+        # Use pygit2 when it is installed to avoid spawning git at all
+        try:
+            import pygit2  # noqa: F401
+        except ImportError:
+            success = _commit_and_tag_with_plumbing(root, files_to_add, commit_message, tag_name)
+        else:
+            success = _commit_and_tag_with_pygit2(root, files_to_add, commit_message, tag_name)
+
+        if not success:
             return False
 
+        print(f"✓ Created commit: {commit_message}")
         print(f"✓ Created tag: {tag_name}")
 
         return True
@@ -196,13 +648,11 @@ def git_commit_and_tag(root: Path, version: str, components: list) -> bool:
 
 def find_project_root() -> Path:
     """Find the project root directory."""
-    current = Path(__file__).resolve().parent
-    # Go up until we find the root (where cli, sdk, sandbox directories are)
-    while current.parent != current:
-        if (current / 'cli').exists() and (current / 'sdk').exists():
-            return current
-        current = current.parent
-    raise RuntimeError("Could not find project root")
+    # This script lives in scripts/, directly under the project root
+    root = Path(__file__).resolve().parent.parent
+    if not (root / 'cli').is_dir() or not (root / 'sdk').is_dir():
+        raise RuntimeError(f"Unexpected project layout at {root}")
+    return root
 
 
 def main():
@@ -218,6 +668,16 @@ def main():
         action='store_true',
         help='Show what would be updated without making changes'
     )
+    parser.add_argument(
+        '--full-lock',
+        action='store_true',
+        help='Regenerate package-lock.json with npm install instead of patching it'
+    )
+    parser.add_argument(
+        '--refresh-deps',
+        action='store_true',
+        help='Update Cargo.lock files with cargo update instead of patching them'
+    )
 
     args = parser.parse_args()
 
@@ -237,28 +697,32 @@ def main():
     print(f"Updating version to: {version}")
     print(f"Project root: {root}\n")
 
+    # Filled in by update_cargo_toml with the name of each crate it updates
+    crate_names = set()
+    update_crate = functools.partial(update_cargo_toml, crate_names=crate_names)
+
     # Define all components to update
     components = [
         # Rust crates
         {
             'version_file': root / 'cli' / 'Cargo.toml',
-            'version_func': update_cargo_toml,
+            'version_func': update_crate,
             'lock_dir': root / 'cli',
-            'lock_func': update_cargo_lock,
+            'lock_func': update_cargo_lock if args.refresh_deps else patch_cargo_lock,
             'name': 'cli'
         },
         {
             'version_file': root / 'sandbox' / 'Cargo.toml',
-            'version_func': update_cargo_toml,
+            'version_func': update_crate,
             'lock_dir': root / 'sandbox',
-            'lock_func': update_cargo_lock,
+            'lock_func': update_cargo_lock if args.refresh_deps else patch_cargo_lock,
             'name': 'sandbox'
         },
         {
             'version_file': root / 'sdk' / 'rust' / 'Cargo.toml',
-            'version_func': update_cargo_toml,
+            'version_func': update_crate,
             'lock_dir': root / 'sdk' / 'rust',
-            'lock_func': update_cargo_lock,
+            'lock_func': update_cargo_lock if args.refresh_deps else patch_cargo_lock,
             'name': 'sdk/rust'
         },
         # TypeScript SDK
@@ -266,54 +730,114 @@ def main():
             'version_file': root / 'sdk' / 'typescript' / 'package.json',
             'version_func': update_package_json,
             'lock_dir': root / 'sdk' / 'typescript',
-            'lock_func': update_package_lock,
+            'lock_func': install_package_lock if args.full_lock else update_package_lock,
             'name': 'sdk/typescript'
         },
     ]
 
+    # Crates that are members of a Cargo workspace share its lock file
+    for component in components:
+        if component['version_file'].name == 'Cargo.toml':
+            component['lock_dir'] = _workspace_root_of(component['version_file'], root)
+
+    # A previous run may have bumped every component already. If it got as
+    # far as the release commit, at most the tag is missing. A run that
+    # failed before committing carries on instead, with the updaters as no-ops.
+    commit_message = f"AgentFS {version}"
+    tag_name = f"v{version}"
+    if all(_current_version(c['version_file']) == version for c in components):
+        is_release_commit, tagged = _head_release_state(root, commit_message, tag_name)
+        if tagged:
+            print(f"All components already at {version} and tagged; nothing to do")
+            sys.exit(0)
+        if is_release_commit:
+            if args.dry_run:
+                print(f"HEAD is already '{commit_message}'; would only create git tag: '{tag_name}'")
+                sys.exit(0)
+            print(f"HEAD is already '{commit_message}'; only creating the tag")
+            if not _tag_head(root, tag_name):
+                print("\n❌ Git operations failed", file=sys.stderr)
+                sys.exit(1)
+            print(f"✓ Created tag: {tag_name}")
+            print("\n✅ Version update complete! Don't forget to push the commit and tag.")
+            sys.exit(0)
+
     if args.dry_run:
         print("DRY RUN - No files will be modified\n")
         for component in components:
             if component['version_file'].exists():
-                print(f"Would update: {component['version_file'].relative_to(root)}")
+                print(f"Would update: {_relative_path(component['version_file'], root)}")
                 print(f"  and lock file in {component['name']}/")
             else:
-                print(f"Warning: File not found: {component['version_file'].relative_to(root)}")
+                print(f"Warning: File not found: {_relative_path(component['version_file'], root)}")
         print("\nWould also:")
-        print(f"  - Create git commit: 'AgentFS {version}'")
-        print(f"  - Create git tag: 'v{version}'")
+        print(f"  - Create git commit: '{commit_message}'")
+        print(f"  - Create git tag: '{tag_name}'")
         sys.exit(0)
 
-    # Update all components
+    # Update all version files first (cheap, done serially)
     all_success = True
+    updated = []
+    pending_writes = []
 
-    for component in components:
-        version_file = component['version_file']
-        if not version_file.exists():
-            print(f"Warning: File not found: {version_file.relative_to(root)}")
-            all_success = False
-            continue
-
-        # Update version file
-        if component['version_func'](version_file, version):
-            # Update lock file
-            if component['lock_func'](component['lock_dir']):
-                print(f"✓ Updated {component['name']} lock file")
+    try:
+        for component in components:
+            version_file = component['version_file']
+            try:
+                success = component['version_func'](version_file, version, root, pending_writes)
+            except FileNotFoundError:
+                print(f"Warning: File not found: {_relative_path(version_file, root)}")
+                success = False
+
+            if success:
+                updated.append(component)
             else:
                 all_success = False
-        else:
-            all_success = False
+
+        # Move the new version files into place together, and only once all
+        # of them were written, so a failed update leaves every file as it was
+        if all_success:
+            for tmp_path, file_path in pending_writes:
+                os.replace(tmp_path, file_path.resolve())
+                print(f" Updated {_relative_path(file_path, root)}")
+    finally:
+        # Temporary files that were not moved into place are left over
+        for tmp_path, _ in pending_writes:
+            tmp_path.unlink(missing_ok=True)
 
     if not all_success:
         print("\n❌ Some files failed to update", file=sys.stderr)
         sys.exit(1)
 
-    # Update cli/Cargo.lock again to pick up new versions of workspace dependencies
-    print("\nUpdating cli/Cargo.lock to pick up new dependency versions...")
-    if update_cargo_lock(root / 'cli'):
-        print("✓ Updated cli/Cargo.lock with new dependency versions")
-    else:
-        print("❌ Failed to update cli/Cargo.lock", file=sys.stderr)
+    # Update each lock file once. By default these are quick in-process edits,
+    # but with --refresh-deps or --full-lock (or when a Cargo.lock is missing)
+    # they spawn cargo or npm, so run them concurrently.
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    lock_jobs = {}
+    for component in updated:
+        lock_func = component['lock_func']
+        if lock_func is patch_cargo_lock:
+            lock_func = functools.partial(patch_cargo_lock, crate_names=frozenset(crate_names))
+        lock_jobs.setdefault(component['lock_dir'], lock_func)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(len(lock_jobs), 1)) as executor:
+        futures = {
+            executor.submit(lock_func, lock_dir, version): lock_dir
+            for lock_dir, lock_func in lock_jobs.items()
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    for lock_dir in lock_jobs:
+        if results[lock_dir]:
+            print(f"✓ Updated {_relative_path(lock_dir, root)} lock file")
+        else:
+            all_success = False
+
+    if not all_success:
+        print("\n❌ Some files failed to update", file=sys.stderr)
         sys.exit(1)
 
     print("\n✅ All files and lock files updated successfully!")